@@ -1,36 +1,147 @@
 """Модуль приложения для хостинга изображений."""
 
+import gzip
+import hashlib
 import http.server
 import re
+import secrets
+import signal
+import socket
+import sys
 import logging
+import logging.handlers
+import queue
 import json
 import os
 import time
+import threading
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from urllib.parse import urlparse, parse_qs
-import uuid
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
 
 STATIC_FILES_DIR = 'static'
 UPLOAD_DIR = 'images'
 MAX_FILE_SIZE = 5 * 1024 * 1024
-ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
+# Кортеж сохраняет порядок для сообщений, frozenset дает проверку за O(1)
+ALLOWED_EXTENSIONS_DISPLAY = ('.jpg', '.jpeg', '.png', '.gif')
+ALLOWED_EXTENSIONS = frozenset(ALLOWED_EXTENSIONS_DISPLAY)
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '2'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '32'))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_DRAIN_LIMIT = 256 * 1024
+IMAGE_FD_CACHE_SIZE = int(os.environ.get('IMAGE_FD_CACHE_SIZE', '256'))
+LOG_QUEUE_SIZE = 10000
+STATIC_RECHECK_INTERVAL = 2.0
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', '30'))
+UPLOAD_TIMEOUT = float(os.environ.get('UPLOAD_TIMEOUT', '120'))
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', '5'))
+LIST_CACHE_TTL = float(os.environ.get('LIST_CACHE_TTL', '5'))
+LIST_CACHE_SIZE = int(os.environ.get('LIST_CACHE_SIZE', '128'))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', str(min(32, (os.cpu_count() or 1) * 4))))
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', '1'))
 log_dir = 'logs'
 
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+# Границы bigint: параметры запросов из URL приводятся к ним, чтобы не получить ошибку БД
+PG_BIGINT_MIN = -2 ** 63
+PG_BIGINT_MAX = 2 ** 63 - 1
 
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
+DELETE_RE = re.compile(r'^/delete/(\d+)$')
+FILENAME_RE = re.compile(rb'filename="([^"]+)"')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Сигнатуры (magic bytes) допустимых форматов изображений
+IMAGE_SIGNATURES = {
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+}
+CONTENT_TYPES = {
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+}
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] %(levelname)s: %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, 'app.log')),
-        logging.StreamHandler()
-    ]
-)
+# Сообщения об ошибках, которые возвращаются клиенту
+ERR_SERVER = "Ошибка сервера"
+ERR_NOT_MULTIPART = "Ожидается multipart/form-data"
+ERR_NO_BOUNDARY = "Boundary не найден"
+ERR_BAD_CONTENT_LENGTH = "Некорректный Content-Length"
+ERR_TRANSFER_ENCODING = "Transfer-Encoding не поддерживается, передайте Content-Length"
+ERR_REQUEST_TOO_LARGE = "Запрос слишком большой"
+ERR_INCOMPLETE_BODY = "Тело запроса получено не полностью"
+ERR_UPLOAD_TIMEOUT = "Превышено время передачи файла"
+ERR_NO_FILE = "Файл не найден в запросе"
+ERR_BAD_EXTENSION = f"Неподдерживаемый формат файла. Допустимы: {', '.join(ALLOWED_EXTENSIONS_DISPLAY)}"
+ERR_BAD_SIGNATURE = "Содержимое файла не соответствует его формату"
+ERR_FILE_TOO_LARGE = f"Файл превышает максимальный размер {MAX_FILE_SIZE / (1024 * 1024):.0f}MB"
+ERR_READ_FAILED = "Ошибка при чтении запроса"
+ERR_SAVE_FAILED = "Произошла ошибка при сохранении файла"
+ERR_DB_SAVE_FAILED = "Ошибка сохранения метаданных в БД"
+
+# Один энкодер на весь процесс: компактные разделители и UTF-8 без \uXXXX-экранирования
+_json_encode = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+
+def encode_json(obj) -> bytes:
+    """Сериализует объект в компактный JSON в кодировке UTF-8."""
+    return _json_encode(obj).encode('utf-8')
+
+
+# Готовые тела JSON-ошибок: все известные сообщения кодируются один раз при импорте
+_error_bodies = {
+    message: encode_json({"status": "error", "message": message})
+    for message in (
+        ERR_SERVER, ERR_NOT_MULTIPART, ERR_NO_BOUNDARY, ERR_BAD_CONTENT_LENGTH, ERR_TRANSFER_ENCODING,
+        ERR_REQUEST_TOO_LARGE, ERR_INCOMPLETE_BODY, ERR_UPLOAD_TIMEOUT, ERR_NO_FILE, ERR_BAD_EXTENSION,
+        ERR_BAD_SIGNATURE, ERR_FILE_TOO_LARGE, ERR_READ_FAILED, ERR_SAVE_FAILED,
+        ERR_DB_SAVE_FAILED,
+    )
+}
+
+# Готовые тела текстовых ответов, чтобы не кодировать строки на каждый запрос
+NOT_FOUND_BODY = b"404 Not Found"
+IMAGE_NOT_FOUND_BODY = "Изображение не найдено".encode('utf-8')
+DELETE_FAILED_BODY = "Ошибка сервера при удалении".encode('utf-8')
+
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(log_dir, exist_ok=True)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполнении очереди отбрасывает запись, а не ждет."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+# Запись логов на диск и в консоль выполняет фоновый поток QueueListener,
+# поток запроса только кладет запись в ограниченную очередь
+_log_queue = queue.Queue(LOG_QUEUE_SIZE)
+_log_formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
+_file_handler = logging.FileHandler(os.path.join(log_dir, 'app.log'))
+_file_handler.setFormatter(_log_formatter)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(_log_formatter)
+_log_listener = logging.handlers.QueueListener(_log_queue, _file_handler, _stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(DroppingQueueHandler(_log_queue))
 
 
 def _resolve_db_defaults():
@@ -46,43 +157,192 @@ def _resolve_db_defaults():
     return default_host, default_port
 
 
-def get_db_connection(max_attempts: int = 30, delay_seconds: float = 1.0):
-    """Создает соединение с PostgreSQL с ретраями ожидания готовности БД.
+def _db_connect_params():
+    """Собирает параметры подключения к БД из переменных окружения."""
+    default_host, default_port = _resolve_db_defaults()
+    return {
+        'dbname': os.environ.get('DB_NAME', 'images_db'),
+        'user': os.environ.get('DB_USER', 'postgres'),
+        'password': os.environ.get('DB_PASSWORD', 'password'),
+        'host': os.environ.get('DB_HOST', default_host),
+        'port': os.environ.get('DB_PORT', default_port),
+    }
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Соединение пула с признаком того, что запросы обработчиков уже подготовлены."""
+    statements_prepared = False
+
+
+# Запросы обработчиков: подготавливаются на сервере один раз для каждого соединения,
+# чтобы PostgreSQL не разбирал и не планировал их заново на каждый HTTP-запрос
+PREPARED_STATEMENTS = (
+    """
+    PREPARE images_list_page (int, bigint) AS
+    SELECT id, filename, original_name, size, size / 1024 AS size_kb,
+           to_char(upload_time, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS upload_time,
+           file_type
+    FROM images
+    ORDER BY id DESC
+    LIMIT $1 OFFSET $2
+    """,
+    """
+    PREPARE images_list_before (bigint, int) AS
+    SELECT id, filename, original_name, size, size / 1024 AS size_kb,
+           to_char(upload_time, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS upload_time,
+           file_type
+    FROM images
+    WHERE id < $1
+    ORDER BY id DESC
+    LIMIT $2
+    """,
+    """
+    PREPARE images_delete (bigint) AS
+    DELETE FROM images WHERE id = $1 RETURNING filename
+    """,
+    """
+    PREPARE images_lock_file (text) AS
+    SELECT pg_advisory_xact_lock(hashtext($1))
+    """,
+    """
+    PREPARE images_file_in_use (text) AS
+    SELECT EXISTS (SELECT 1 FROM images WHERE filename = $1)
+    """,
+    """
+    PREPARE images_insert (text, text, int, text) AS
+    INSERT INTO images (filename, original_name, size, file_type)
+    VALUES ($1, $2, $3, $4)
+    RETURNING id
+    """,
+)
+
+
+def prepare_statements(conn):
+    """Подготавливает запросы обработчиков на новом соединении."""
+    with conn.cursor() as cursor:
+        # Все PREPARE уходят на сервер одним запросом
+        cursor.execute(";".join(PREPARED_STATEMENTS))
+    conn.commit()
+    conn.statements_prepared = True
+
+
+def create_db_pool(max_attempts: int = 30, delay_seconds: float = 1.0):
+    """Создает пул соединений с PostgreSQL с ретраями ожидания готовности БД.
 
     max_attempts: сколько раз пробовать подключиться
     delay_seconds: задержка между попытками
     """
-    default_host, default_port = _resolve_db_defaults()
-    database_name = os.environ.get('DB_NAME', 'images_db')
-    database_user = os.environ.get('DB_USER', 'postgres')
-    database_password = os.environ.get('DB_PASSWORD', 'password')
-    database_host = os.environ.get('DB_HOST', default_host)
-    database_port = os.environ.get('DB_PORT', default_port)
+    params = _db_connect_params()
 
     last_error = None
     for attempt in range(1, max_attempts + 1):
         try:
-            return psycopg2.connect(
-                dbname=database_name,
-                user=database_user,
-                password=database_password,
-                host=database_host,
-                port=database_port,
+            return ThreadedConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX, connection_factory=PooledConnection, **params
             )
         except Exception as e:
             last_error = e
             logging.warning(
-                f"Ожидание БД (попытка {attempt}/{max_attempts}) — ошибка подключения: {e}"
+                "Ожидание БД (попытка %s/%s) — ошибка подключения: %s", attempt, max_attempts, e
             )
             time.sleep(delay_seconds)
     # Если не удалось подключиться после всех попыток — выбрасываем последнюю ошибку
     raise last_error
 
 
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """Возвращает пул соединений, создавая его при первом обращении."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = create_db_pool()
+    return _db_pool
+
+
+def close_db_pool():
+    """Закрывает пул соединений; следующий вызов get_db_pool создаст новый."""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
+
+@contextmanager
+def db_conn(prepare: bool = True, autocommit: bool = False):
+    """Выдает соединение из пула и возвращает его обратно после использования.
+
+    При успешном выходе транзакция фиксируется, при исключении — откатывается.
+    Разорванные соединения закрываются, а не возвращаются в пул.
+    prepare: подготовить запросы обработчиков (PREPARED_STATEMENTS), если
+    это соединение еще не использовалось
+    autocommit: выполнять запросы без BEGIN/COMMIT — для одиночных чтений
+    это экономит два обращения к серверу
+    """
+    pool = get_db_pool()
+    conn = pool.getconn()
+    try:
+        if prepare and not conn.statements_prepared:
+            prepare_statements(conn)
+        conn.autocommit = autocommit
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if autocommit and not conn.closed:
+            conn.autocommit = False
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+# Число строк в images: ведется в памяти, чтобы не выполнять COUNT(*) на каждый запрос списка
+_row_count = None
+_row_count_loaded_at = 0.0
+_row_count_lock = threading.Lock()
+
+
+def load_row_count(cursor):
+    """Считает строки в images и запоминает результат в счетчике."""
+    global _row_count, _row_count_loaded_at
+    cursor.execute("SELECT COUNT(*) FROM images")
+    count = int(cursor.fetchone()[0])
+    with _row_count_lock:
+        _row_count = count
+        _row_count_loaded_at = time.monotonic()
+    return count
+
+
+def cached_row_count():
+    """Возвращает счетчик строк или None, если его нужно перечитать из БД.
+
+    При нескольких процессах счетчик не видит изменений в соседних процессах,
+    поэтому считается актуальным не дольше LIST_CACHE_TTL секунд.
+    """
+    with _row_count_lock:
+        if WORKER_PROCESSES > 1 and time.monotonic() - _row_count_loaded_at >= LIST_CACHE_TTL:
+            return None
+        return _row_count
+
+
+def adjust_row_count(delta: int):
+    """Изменяет счетчик строк после вставки или удаления."""
+    global _row_count
+    with _row_count_lock:
+        if _row_count is not None:
+            _row_count += delta
+
+
 def init_db():
     """Создает таблицу images, если она не существует."""
     try:
-        with get_db_connection() as conn:
+        with db_conn(prepare=False) as conn:
             with conn.cursor() as cursor:
                 cursor.execute(
                     """
@@ -94,34 +354,346 @@ def init_db():
                         upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         file_type TEXT NOT NULL
                     );
+                    CREATE INDEX IF NOT EXISTS images_filename_idx ON images (filename);
                     """
                 )
-                conn.commit()
+                load_row_count(cursor)
         logging.info("Инициализация БД: таблица images готова")
     except Exception as e:
-        logging.error(f"Ошибка инициализации БД: {e}")
+        logging.error("Ошибка инициализации БД: %s", e)
 
 
 init_db()
 
 
+# LRU-кэш ответов /images-list: (page, before_id) -> (время истечения, тело, ETag).
+# Ключи задает клиент, поэтому размер ограничен LIST_CACHE_SIZE записями
+_list_cache = OrderedDict()
+_list_cache_generation = 0
+_list_cache_lock = threading.Lock()
+
+
+def invalidate_list_cache():
+    """Сбрасывает кэш списка изображений после загрузки или удаления."""
+    global _list_cache_generation
+    with _list_cache_lock:
+        _list_cache.clear()
+        _list_cache_generation += 1
+
+
+# Пул буферов разбора загрузок: после прогрева загрузки не выделяют новую память
+UPLOAD_BUFFER_SIZE = 2 * UPLOAD_CHUNK_SIZE
+_upload_buffers = queue.LifoQueue(maxsize=SERVER_WORKERS)
+
+
+def acquire_upload_buffer() -> bytearray:
+    """Берет буфер разбора загрузки из пула или создает новый."""
+    try:
+        return _upload_buffers.get_nowait()
+    except queue.Empty:
+        return bytearray(UPLOAD_BUFFER_SIZE)
+
+
+def release_upload_buffer(buf: bytearray):
+    """Возвращает буфер в пул; лишние буферы просто освобождаются."""
+    try:
+        _upload_buffers.put_nowait(buf)
+    except queue.Full:
+        pass
+
+
+def write_all(fd: int, data):
+    """Записывает буфер в дескриптор целиком, повторяя os.write при частичной записи."""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def create_upload_file():
+    """Создает файл для записи загрузки в UPLOAD_DIR.
+
+    На Linux используется O_TMPFILE: у файла нет имени, пока его не опубликуют,
+    и после сбоя на диске ничего не остается. Иначе файл создается под скрытым
+    временным именем. Возвращает (fd, temp_path), для O_TMPFILE temp_path равен None.
+    """
+    if hasattr(os, 'O_TMPFILE') and os.path.isdir('/proc/self/fd'):
+        try:
+            return os.open(UPLOAD_DIR, os.O_TMPFILE | os.O_WRONLY, 0o644), None
+        except OSError:
+            # Файловая система не поддерживает O_TMPFILE
+            pass
+    temp_path = os.path.join(UPLOAD_DIR, f".{secrets.token_hex(16)}.part")
+    return os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644), temp_path
+
+
+def publish_upload(fd: int, temp_path, target_path: str):
+    """Атомарно делает записанный файл видимым под итоговым именем.
+
+    Если файл с таким именем уже есть, выбрасывает FileExistsError.
+    """
+    if temp_path is None:
+        # linkat(AT_SYMLINK_FOLLOW) по /proc/self/fd дает безымянному файлу имя.
+        # os.link вызывает linkat с этим флагом только при заданном dir_fd,
+        # без него — link(), который не следует по ссылке /proc
+        dir_fd = os.open(os.path.dirname(target_path) or '.', os.O_RDONLY)
+        try:
+            os.link(f'/proc/self/fd/{fd}', os.path.basename(target_path), dst_dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+    else:
+        # Жесткая ссылка, а не os.replace: существующий файл не перезаписывается
+        os.link(temp_path, target_path)
+
+
+def discard_upload_file(fd: int, temp_path):
+    """Закрывает дескриптор загрузки и удаляет временное имя, если оно осталось."""
+    os.close(fd)
+    if temp_path is not None:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def get_content_type(file_path: str) -> str:
+    """Определяет MIME-тип по расширению файла."""
+    return CONTENT_TYPES.get(os.path.splitext(file_path)[1].lower(), 'application/octet-stream')
+
+
+class CachedFile:
+    """Открытый дескриптор файла в кэше вместе с его метаданными и счетчиком ссылок."""
+    __slots__ = ('fd', 'size', 'mtime', 'content_type', 'refs', 'evicted', 'gzipped')
+
+    def __init__(self, fd, size, mtime, content_type, gzipped=None):
+        self.fd = fd
+        self.size = size
+        self.mtime = mtime
+        self.content_type = content_type
+        self.refs = 0
+        self.evicted = False
+        # Заранее сжатое содержимое (только для главной страницы)
+        self.gzipped = gzipped
+
+
+# LRU-кэш открытых дескрипторов часто запрашиваемых изображений: имя -> CachedFile.
+# Дескриптор вытесненной записи закрывается, когда его перестают использовать
+_image_fd_cache = OrderedDict()
+_image_fd_cache_lock = threading.Lock()
+
+
+def _close_if_unused(entry):
+    if entry.evicted and entry.refs == 0:
+        os.close(entry.fd)
+
+
+def acquire_image(filename: str) -> CachedFile:
+    """Возвращает дескриптор изображения из кэша, открывая файл при первом обращении.
+
+    После использования запись нужно вернуть через release_file.
+    """
+    with _image_fd_cache_lock:
+        entry = _image_fd_cache.get(filename)
+        if entry is not None and WORKER_PROCESSES > 1 and os.fstat(entry.fd).st_nlink == 0:
+            # Файл удален в другом процессе, который не может сбросить наш кэш
+            del _image_fd_cache[filename]
+            entry.evicted = True
+            _close_if_unused(entry)
+            entry = None
+        if entry is not None:
+            _image_fd_cache.move_to_end(filename)
+            entry.refs += 1
+            return entry
+
+    fd = os.open(os.path.join(UPLOAD_DIR, filename), os.O_RDONLY)
+    with _image_fd_cache_lock:
+        entry = _image_fd_cache.get(filename)
+        if entry is not None:
+            # Другой поток успел открыть этот же файл
+            os.close(fd)
+        else:
+            # fstat под блокировкой: handle_delete удаляет файл до evict_image, поэтому
+            # файл, удаленный после нашего open, виден здесь как st_nlink == 0
+            st = os.fstat(fd)
+            if st.st_nlink == 0:
+                os.close(fd)
+                raise FileNotFoundError(filename)
+            entry = _image_fd_cache[filename] = CachedFile(fd, st.st_size, st.st_mtime, get_content_type(filename))
+            while len(_image_fd_cache) > IMAGE_FD_CACHE_SIZE:
+                _, oldest = _image_fd_cache.popitem(last=False)
+                oldest.evicted = True
+                _close_if_unused(oldest)
+        _image_fd_cache.move_to_end(filename)
+        entry.refs += 1
+        return entry
+
+
+def release_file(entry: CachedFile):
+    """Возвращает запись, полученную через acquire_image или acquire_index_page."""
+    with _image_fd_cache_lock:
+        entry.refs -= 1
+        _close_if_unused(entry)
+
+
+def evict_image(filename: str):
+    """Убирает изображение из кэша дескрипторов (например, после удаления файла)."""
+    with _image_fd_cache_lock:
+        entry = _image_fd_cache.pop(filename, None)
+        if entry is not None:
+            entry.evicted = True
+            _close_if_unused(entry)
+
+
+@atexit.register
+def _close_image_fds():
+    with _image_fd_cache_lock:
+        while _image_fd_cache:
+            _, entry = _image_fd_cache.popitem()
+            entry.evicted = True
+            _close_if_unused(entry)
+
+
+INDEX_PATH = os.path.join(STATIC_FILES_DIR, 'index.html')
+# Главная страница: дескриптор держится открытым, файл переоткрывается при изменении mtime
+_index_page = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def acquire_index_page() -> CachedFile:
+    """Возвращает открытый дескриптор static/index.html.
+
+    Изменения файла проверяются не чаще раза в STATIC_RECHECK_INTERVAL секунд.
+    После использования запись нужно вернуть через release_file.
+    """
+    global _index_page, _index_checked_at
+    now = time.monotonic()
+    with _index_lock:
+        if _index_page is None or now - _index_checked_at >= STATIC_RECHECK_INTERVAL:
+            st = os.stat(INDEX_PATH)
+            if _index_page is None or (st.st_mtime, st.st_size) != (_index_page.mtime, _index_page.size):
+                fd = os.open(INDEX_PATH, os.O_RDONLY)
+                st = os.fstat(fd)
+                # Сжимаем страницу один раз при загрузке, а не на каждый запрос
+                gzipped = gzip.compress(os.pread(fd, st.st_size, 0), compresslevel=6)
+                if len(gzipped) >= st.st_size:
+                    gzipped = None
+                page = CachedFile(fd, st.st_size, st.st_mtime, 'text/html; charset=utf-8', gzipped)
+                if _index_page is not None:
+                    with _image_fd_cache_lock:
+                        _index_page.evicted = True
+                        _close_if_unused(_index_page)
+                _index_page = page
+            _index_checked_at = now
+        with _image_fd_cache_lock:
+            _index_page.refs += 1
+        return _index_page
+
+
+class UploadError(Exception):
+    """Ошибка приема загружаемого файла, которую нужно вернуть клиенту."""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
 class ImageHostingHandler(http.server.BaseHTTPRequestHandler):
-    def _set_headers(self, status_code=200, content_type='text/html'):
+    # Keep-alive: у всех ответов есть Content-Length, соединение переиспользуется
+    protocol_version = "HTTP/1.1"
+    # Медленный или простаивающий клиент не занимает поток пула дольше этого времени
+    timeout = REQUEST_TIMEOUT
+    _waiting_next_request = False
+
+    def _set_tcp_cork(self, enabled: bool):
+        """Включает TCP_CORK (Linux), чтобы заголовки и начало тела уходили общими сегментами."""
+        if hasattr(socket, 'TCP_CORK'):
+            try:
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(enabled))
+            except OSError:
+                pass
+
+    def log_message(self, format, *args):
+        # Журнал доступа тоже пишется через очередь логирования, а не напрямую в stderr.
+        # Управляющие символы из строки запроса экранируются, как в BaseHTTPRequestHandler
+        message = format % args
+        logging.info("%s - %s", self.address_string(), message.translate(self._control_char_table))
+
+    def log_error(self, format, *args):
+        # Закрытие простаивающего keep-alive соединения по таймауту — штатная ситуация
+        if self._waiting_next_request and format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+    def send_response(self, code, message=None):
+        # Сокет «закупоривается» до конца обработки запроса, см. handle_one_request
+        self._set_tcp_cork(True)
+        super().send_response(code, message)
+        if not self.close_connection and not self.server.has_free_worker():
+            # Простаивающее keep-alive соединение держит поток пула. Последний свободный
+            # поток ему не отдаем, иначе новые клиенты ждали бы до KEEPALIVE_TIMEOUT
+            self.close_connection = True
+
+    def _send_connection_close(self):
+        """Добавляет Connection: close, если соединение закроется, а заголовка еще нет.
+
+        send_error добавляет этот заголовок сам, поэтому буфер проверяется.
+        """
+        if not self.close_connection or self.request_version == 'HTTP/0.9':
+            return
+        for line in self._headers_buffer:
+            if line[:11].lower() == b'connection:':
+                return
+        self.send_header('Connection', 'close')
+
+    def end_headers(self):
+        self._send_connection_close()
+        super().end_headers()
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            # Снимаем TCP_CORK: ядро сразу отправляет все, что накопилось
+            self._set_tcp_cork(False)
+        if not self.close_connection:
+            # Следующего запроса по keep-alive ждем недолго, чтобы не держать поток пула
+            self._waiting_next_request = True
+            self.connection.settimeout(KEEPALIVE_TIMEOUT)
+
+    def parse_request(self):
+        # Запрос пришел: на его чтение и обработку снова действует полный таймаут
+        if self._waiting_next_request:
+            self._waiting_next_request = False
+            self.connection.settimeout(self.timeout)
+        if not super().parse_request():
+            return False
+        # Тело читает только загрузка, и только по Content-Length. Иначе непрочитанные
+        # байты тела были бы разобраны как следующий запрос на этом соединении
+        is_upload = self.command == 'POST' and urlparse(self.path).path == '/upload'
+        if 'Transfer-Encoding' in self.headers or (
+            not is_upload and self.headers.get('Content-Length', '0').strip() not in ('', '0')
+        ):
+            self.close_connection = True
+        return True
+
+    def _send_full(self, status_code, content_type, body: bytes, headers=()):
+        """Отправляет статус, заголовки и тело ответа одним вызовом write."""
         self.send_response(status_code)
         self.send_header('Content-type', content_type)
-        self.end_headers()
-
-    def _get_content_type(self, file_path):
-        if file_path.endswith('.html'):
-            return 'text/html'
-        elif file_path.endswith('.css'):
-            return 'text/css'
-        elif file_path.endswith('.js'):
-            return 'application/javascript'
-        elif file_path.endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            return 'image/' + file_path.split('.')[-1]
-        else:
-            return 'application/octet-stream'
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.request_version == 'HTTP/0.9':
+            # У HTTP/0.9 нет заголовков, буфер не создается
+            self.wfile.write(body)
+            return
+        # То же, что end_headers(), но тело уходит в одном буфере с заголовками
+        self._send_connection_close()
+        self._headers_buffer.append(b"\r\n")
+        self._headers_buffer.append(body)
+        self.flush_headers()
 
     def handle_images_list(self, parsed_path):
         query = parse_qs(parsed_path.query)
@@ -131,38 +703,65 @@ class ImageHostingHandler(http.server.BaseHTTPRequestHandler):
                 page = 1
         except Exception:
             page = 1
+        # Keyset-пагинация: ?before_id=<id> отдает записи старше указанной
+        try:
+            before_id = int(query['before_id'][0]) if 'before_id' in query else None
+        except ValueError:
+            before_id = None
         per_page = 10
+        # Слишком большие значения дают пустую страницу, а не ошибку «out of range» в БД
+        page = min(page, PG_BIGINT_MAX // per_page)
+        if before_id is not None:
+            before_id = min(max(before_id, PG_BIGINT_MIN), PG_BIGINT_MAX)
         offset = (page - 1) * per_page
 
-        total = 0
+        cache_key = (page, before_id)
+        with _list_cache_lock:
+            cached = _list_cache.get(cache_key)
+            if cached is not None:
+                _list_cache.move_to_end(cache_key)
+            generation = _list_cache_generation
+        if cached and cached[0] > time.monotonic():
+            self._send_list_response(cached[1], cached[2])
+            return
+
+        total = cached_row_count()
         rows = []
         try:
-            with get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute("SELECT COUNT(*) AS cnt FROM images")
-                    total = int(cursor.fetchone()['cnt'])
-                    cursor.execute(
-                        """
-                        SELECT id, filename, original_name, size, upload_time, file_type
-                        FROM images
-                        ORDER BY upload_time DESC
-                        LIMIT %s OFFSET %s
-                        """,
-                        (per_page, offset),
-                    )
-                    rows = cursor.fetchall()
+            # Только чтение: запросы выполняются без открытия транзакции
+            with db_conn(autocommit=True) as conn:
+                if total is None:
+                    # Счетчик не инициализирован (например, БД была недоступна при старте)
+                    with conn.cursor() as cursor:
+                        total = load_row_count(cursor)
+                with conn.cursor() as cursor:
+                    if before_id is not None:
+                        # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+                        cursor.execute("EXECUTE images_list_before (%s, %s)", (before_id, per_page + 1))
+                    else:
+                        cursor.execute("EXECUTE images_list_page (%s, %s)", (per_page, offset))
+                    rows = [
+                        {
+                            'id': r[0],
+                            'filename': r[1],
+                            'original_name': r[2],
+                            'size': r[3],
+                            'size_kb': r[4],
+                            'upload_time': r[5],
+                            'file_type': r[6],
+                        }
+                        for r in cursor.fetchall()
+                    ]
         except Exception as e:
-            logging.error(f"Ошибка при получении списка изображений: {e}")
-            self._set_headers(500, 'application/json')
-            self.wfile.write(json.dumps({"status": "error", "message": "Ошибка сервера"}).encode('utf-8'))
+            logging.error("Ошибка при получении списка изображений: %s", e)
+            self._send_error(500, ERR_SERVER)
             return
 
-        # Преобразуем datetime в строки для JSON
-        for row in rows:
-            if 'upload_time' in row and row['upload_time']:
-                row['upload_time'] = row['upload_time'].isoformat()
-            if 'size' in row:
-                row['size_kb'] = int(row['size']) // 1024
+        if before_id is not None:
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+        else:
+            has_next = offset + per_page < total
 
         response = {
             "status": "success",
@@ -170,211 +769,627 @@ class ImageHostingHandler(http.server.BaseHTTPRequestHandler):
                 "images": rows,
                 "pagination": {
                     "total": total,
-                    "page": page,
+                    "page": page if before_id is None else None,
                     "per_page": per_page,
-                    "has_prev": page > 1,
-                    "has_next": offset + per_page < total,
-                    "total_pages": (total + per_page - 1) // per_page
+                    "has_prev": page > 1 if before_id is None else None,
+                    "has_next": has_next,
+                    "total_pages": (total + per_page - 1) // per_page,
+                    "before_id": before_id,
+                    "next_before_id": rows[-1]['id'] if has_next and rows else None
                 }
             }
         }
 
-        self._set_headers(200, 'application/json')
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        body = encode_json(response)
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with _list_cache_lock:
+            # Не кэшируем ответ, если список успел измениться во время запроса
+            if generation == _list_cache_generation:
+                _list_cache[cache_key] = (time.monotonic() + LIST_CACHE_TTL, body, etag)
+                _list_cache.move_to_end(cache_key)
+                while len(_list_cache) > LIST_CACHE_SIZE:
+                    _list_cache.popitem(last=False)
+        self._send_list_response(body, etag)
+
+    def _send_list_response(self, body: bytes, etag: str):
+        """Отправляет JSON списка с ETag или 304, если у клиента актуальная версия."""
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self._send_full(200, 'application/json', body, (('ETag', etag),))
 
     def handle_delete(self, image_id: int):
-        filename = None
         try:
-            with get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute("SELECT filename FROM images WHERE id = %s", (image_id,))
+            with db_conn() as conn:
+                with conn.cursor() as cursor:
+                    # Удаление и получение имени файла за один запрос
+                    cursor.execute("EXECUTE images_delete (%s)", (image_id,))
                     row = cursor.fetchone()
                     if not row:
-                        self._set_headers(404, 'text/html; charset=utf-8')
-                        self.wfile.write("Изображение не найдено".encode('utf-8'))
+                        self._send_full(404, 'text/html; charset=utf-8', IMAGE_NOT_FOUND_BODY)
                         return
-                    filename = row['filename']
-                    cursor.execute("DELETE FROM images WHERE id = %s", (image_id,))
-                    conn.commit()
-            
-            if filename:
-                try:
-                    os.remove(os.path.join(UPLOAD_DIR, filename))
-                    logging.info(f"Удалено изображение {filename} и запись id={image_id}")
-                except FileNotFoundError:
-                    logging.warning(f"Файл {filename} не найден на диске при удалении записи id={image_id}")
+                    filename = row[0]
+                    # Файл может принадлежать нескольким записям с одинаковым содержимым.
+                    # Под блокировкой имени проверяем, остались ли ссылки, и удаляем файл
+                    # до коммита, чтобы параллельная загрузка не сослалась на удаляемый файл
+                    cursor.execute("EXECUTE images_lock_file (%s)", (filename,))
+                    cursor.execute("EXECUTE images_file_in_use (%s)", (filename,))
+                    if cursor.fetchone()[0]:
+                        logging.info("Удалена запись id=%s, файл %s используется другими записями", image_id, filename)
+                    else:
+                        # Сначала удаляем файл, потом сбрасываем кэш: дескриптор, открытый
+                        # до удаления, либо будет сброшен, либо не попадет в кэш (см. acquire_image)
+                        try:
+                            os.remove(os.path.join(UPLOAD_DIR, filename))
+                            logging.info("Удалено изображение %s и запись id=%s", filename, image_id)
+                        except FileNotFoundError:
+                            logging.warning("Файл %s не найден на диске при удалении записи id=%s", filename, image_id)
+                        finally:
+                            evict_image(filename)
+            adjust_row_count(-1)
+            invalidate_list_cache()
         except Exception as e:
-            logging.error(f"Ошибка удаления изображения id={image_id}: {e}")
-            self._set_headers(500, 'text/html; charset=utf-8')
-            self.wfile.write("Ошибка сервера при удалении".encode('utf-8'))
+            logging.error("Ошибка удаления изображения id=%s: %s", image_id, e)
+            self._send_full(500, 'text/html; charset=utf-8', DELETE_FAILED_BODY)
             return
 
         self.send_response(303)
         self.send_header('Location', '/images-list')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
+    def handle_image_file(self, filename: str):
+        """Отдает загруженное изображение через sendfile(2), без копирования в user space."""
+        # NUL в имени os.open отвергает ValueError, а не OSError — отсекаем заранее
+        if (not filename or filename != os.path.basename(filename) or filename.startswith('.')
+                or '\x00' in filename):
+            self._send_full(404, 'text/plain', NOT_FOUND_BODY)
+            return
+
+        try:
+            image = acquire_image(filename)
+        except OSError:
+            self._send_full(404, 'text/plain', NOT_FOUND_BODY)
+            return
+
+        try:
+            byte_range = self._parse_range(image.size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{image.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range:
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{image.size}')
+            else:
+                start, end = 0, image.size - 1
+                self.send_response(200)
+            self.send_header('Content-Type', image.content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Last-Modified', self.date_time_string(image.mtime))
+            self.end_headers()
+            self.wfile.flush()
+            self._send_file_range(image.fd, start, end - start + 1)
+        finally:
+            release_file(image)
+
+    def _parse_range(self, size: int):
+        """Разбирает заголовок Range (один диапазон байтов).
+
+        Возвращает (start, end) для частичного ответа, () если Range нет или он
+        не поддерживается (отдаем файл целиком), None если диапазон вне файла.
+        """
+        match = RANGE_RE.match(self.headers.get('Range', ''))
+        if not match or match.group(1) == match.group(2) == '':
+            return ()
+        if match.group(1) == '':
+            # Суффиксный диапазон: последние N байт
+            length = int(match.group(2))
+            if length == 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(match.group(1))
+        if start >= size:
+            # В том числе открытый диапазон от конца файла (докачка уже полного файла)
+            return None
+        if match.group(2) == '':
+            return start, size - 1
+        end = int(match.group(2))
+        if end < start:
+            # Синтаксически неверный диапазон игнорируется (RFC 7233)
+            return ()
+        return start, min(end, size - 1)
+
+    def handle_home_page(self):
+        """Отдает static/index.html из открытого дескриптора через sendfile."""
+        try:
+            page = acquire_index_page()
+        except OSError:
+            self._send_full(404, 'text/plain', NOT_FOUND_BODY)
+            return
+
+        try:
+            last_modified = self.date_time_string(page.mtime)
+            if page.gzipped is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                self._send_full(200, page.content_type, page.gzipped, (
+                    ('Content-Encoding', 'gzip'),
+                    ('Vary', 'Accept-Encoding'),
+                    ('Last-Modified', last_modified),
+                ))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', page.content_type)
+            self.send_header('Content-Length', str(page.size))
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.flush()
+            self._send_file_range(page.fd, 0, page.size)
+        finally:
+            release_file(page)
+
+    def _send_file_range(self, fd: int, offset: int, count: int):
+        """Отправляет count байт файла начиная с offset через os.sendfile (или pread, если его нет)."""
+        if hasattr(os, 'sendfile'):
+            # socket.sendfile сам дожидается готовности сокета с таймаутом (он неблокирующий)
+            with open(fd, 'rb', closefd=False) as f:
+                self.connection.sendfile(f, offset, count)
+            return
+        while count > 0:
+            sent = self.connection.send(os.pread(fd, min(count, UPLOAD_CHUNK_SIZE), offset))
+            if sent == 0:
+                break
+            offset += sent
+            count -= sent
+
     def do_GET(self):
         parsed_path = urlparse(self.path)
         if parsed_path.path == '/images-list':
             self.handle_images_list(parsed_path)
             return
 
+        if parsed_path.path in ('/', '/index.html'):
+            self.handle_home_page()
+            return
+
+        if parsed_path.path.startswith('/images/'):
+            self.handle_image_file(parsed_path.path[len('/images/'):])
+            return
+
         # Удаление через GET (для простоты; в проде лучше POST/DELETE)
-        delete_match = re.match(r'^/delete/(\d+)$', parsed_path.path)
+        delete_match = DELETE_RE.match(parsed_path.path)
         if delete_match:
             image_id = int(delete_match.group(1))
+            if image_id > PG_BIGINT_MAX:
+                # Такого id не может быть в таблице
+                self._send_full(404, 'text/html; charset=utf-8', IMAGE_NOT_FOUND_BODY)
+                return
             self.handle_delete(image_id)
             return
 
-        logging.warning(f"Действие: Неожиданный GET запрос: {self.path}.")
-        self._set_headers(404, 'text/plain')
-        self.wfile.write(b"404 Not Found")
+        logging.warning("Действие: Неожиданный GET запрос: %s.", self.path.translate(self._control_char_table))
+        self._send_full(404, 'text/plain', NOT_FOUND_BODY)
 
 
     def do_POST(self):
         parsed_path = urlparse(self.path)
         if parsed_path.path != '/upload':
-            logging.warning(f"Неизвестный POST запрос на: {self.path}")
-            self._set_headers(404, 'text/plain')
-            self.wfile.write(b"404 Not Found")
+            logging.warning("Неизвестный POST запрос на: %s", self.path.translate(self._control_char_table))
+            self.close_connection = True
+            self._send_full(404, 'text/plain', NOT_FOUND_BODY)
+            return
+
+        # Тело частями (chunked) не разбирается: соединение закрывается в parse_request
+        if 'Transfer-Encoding' in self.headers:
+            self._send_error(411, ERR_TRANSFER_ENCODING)
             return
-            
+
         # Проверка Content-Type
         content_type_header = self.headers.get('Content-Type', '')
         if not content_type_header.startswith('multipart/form-data'):
-            self._send_error(400, "Ожидается multipart/form-data")
+            self.close_connection = True
+            self._send_error(400, ERR_NOT_MULTIPART)
             return
 
         # Извлечение boundary
         try:
             boundary = content_type_header.split('boundary=')[1].encode('utf-8')
         except IndexError:
-            self._send_error(400, "Boundary не найден")
+            self.close_connection = True
+            self._send_error(400, ERR_NO_BOUNDARY)
             return
 
-        # Чтение тела запроса
+        # Проверка длины тела запроса
         try:
             content_length = int(self.headers.get('Content-Length', 0))
-            if content_length > MAX_FILE_SIZE * 2:
-                self._send_error(413, "Запрос слишком большой")
-                return
-            raw_body = self.rfile.read(content_length)
         except (TypeError, ValueError):
-            self._send_error(411, "Некорректный Content-Length")
+            self.close_connection = True
+            self._send_error(411, ERR_BAD_CONTENT_LENGTH)
             return
-        except Exception as e:
-            logging.error(f"Ошибка при чтении тела запроса: {e}")
-            self._send_error(500, "Ошибка при чтении запроса")
+        if content_length > MAX_FILE_SIZE * 2:
+            self.close_connection = True
+            self._send_error(413, ERR_REQUEST_TOO_LARGE)
             return
 
-        # Парсинг multipart/form-data
-        file_data, filename = self._parse_multipart(raw_body, boundary)
-        if not file_data or not filename:
-            self._send_error(400, "Файл не найден в запросе")
+        # Потоковый прием файла сразу на диск. Таймаут сокета ограничивает каждое чтение,
+        # а общий срок — всю передачу, иначе клиент, присылающий по байту, держал бы поток
+        self._upload_deadline = time.monotonic() + UPLOAD_TIMEOUT
+        try:
+            filename, unique_filename, file_size, fd, temp_path = self._receive_upload(boundary, content_length)
+        except UploadError as e:
+            self._send_error(e.status_code, e.message)
+            return
+        except OSError as e:
+            logging.error("Ошибка при сохранении файла: %s", e)
+            self.close_connection = True
+            self._send_error(500, ERR_SAVE_FAILED)
+            return
+        except Exception as e:
+            logging.error("Ошибка при чтении тела запроса: %s", e)
+            self.close_connection = True
+            self._send_error(500, ERR_READ_FAILED)
             return
 
-        # Проверка файла
-        file_size = len(file_data)
         file_extension = os.path.splitext(filename)[1].lower()
 
-        if file_extension not in ALLOWED_EXTENSIONS:
-            self._send_error(400, f"Неподдерживаемый формат файла. Допустимы: {', '.join(ALLOWED_EXTENSIONS)}")
+        # Публикуем файл и сохраняем метаданные в БД. Файл к этому моменту уже записан
+        # потоково; fsync намеренно не вызывается, чтобы не ждать диск на пути ответа
+        try:
+            new_id = self._save_to_db(fd, temp_path, unique_filename, filename, file_size, file_extension)
+        except OSError as e:
+            logging.error("Ошибка при сохранении файла: %s", e)
+            self._send_error(500, ERR_SAVE_FAILED)
             return
-
-        if file_size > MAX_FILE_SIZE:
-            self._send_error(400, f"Файл превышает максимальный размер {MAX_FILE_SIZE / (1024 * 1024):.0f}MB")
+        except Exception as db_err:
+            logging.error("Ошибка записи метаданных в БД: %s", db_err)
+            self._send_error(500, ERR_DB_SAVE_FAILED)
             return
+        finally:
+            discard_upload_file(fd, temp_path)
 
-        # Сохранение файла
-        unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-        target_path = os.path.join(UPLOAD_DIR, unique_filename)
+        invalidate_list_cache()
+        file_url = f"/images/{unique_filename}"
+        logging.info("Изображение '%s' сохранено как '%s' (id=%s)", filename, unique_filename, new_id)
+        response = {
+            "status": "success",
+            "message": "Файл успешно загружен",
+            "filename": unique_filename,
+            "url": file_url,
+            "id": new_id,
+            "original_name": filename,
+            "size": file_size,
+            "file_type": file_extension.lstrip('.')
+        }
+        self._send_full(200, 'application/json', encode_json(response))
 
+    def _send_error(self, status_code, message):
+        """Вспомогательный метод для отправки ошибок в формате JSON"""
+        body = _error_bodies.get(message)
+        if body is None:
+            body = _error_bodies[message] = encode_json({"status": "error", "message": message})
+        self._send_full(status_code, 'application/json', body)
+
+    def _receive_upload(self, boundary, content_length):
+        """Потоковый разбор multipart/form-data с записью файла на диск.
+
+        Тело читается блоками по UPLOAD_CHUNK_SIZE в буфер фиксированного размера
+        из пула, поэтому в памяти держится только текущий блок, а не весь запрос.
+        Имя на диске — BLAKE2b-хэш содержимого, он считается по ходу записи.
+        Возвращает кортеж (исходное имя, имя на диске, размер, fd, temp_path):
+        файл еще не опубликован, его дескриптор закрывает вызывающий код через
+        discard_upload_file. При ошибке файл удаляется и выбрасывается UploadError.
+        """
+        buf = acquire_upload_buffer()
+        view = memoryview(buf)
         try:
-            # Сохраняем файл на диск
-            with open(target_path, 'wb') as f:
-                f.write(file_data)
+            return self._parse_upload(buf, view, boundary, content_length)
+        finally:
+            view.release()
+            release_upload_buffer(buf)
+            # _read_body мог сократить таймаут сокета под остаток срока
+            self.connection.settimeout(self.timeout)
+
+    def _read_body(self, view):
+        """Читает в view то, что уже пришло от клиента (один recv), с учетом срока загрузки.
 
-            # Сохраняем метаданные в БД
+        По истечении срока выбрасывает TimeoutError.
+        """
+        left = self._upload_deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError
+        if left < self.timeout:
+            # Последнее чтение не должно ждать дольше оставшегося срока
+            self.connection.settimeout(left)
+        return self.rfile.readinto1(view)
+
+    def _parse_upload(self, buf, view, boundary, content_length):
+        """Разбирает тело загрузки в переданном буфере, см. _receive_upload."""
+        delimiter = b'--' + boundary
+        terminator = b'\r\n' + delimiter
+        remaining = content_length
+        # Данные в буфере занимают buf[:length]
+        length = 0
+
+        def fill():
+            # Дочитывает очередной блок в свободную часть буфера
+            nonlocal remaining, length
+            size = min(UPLOAD_CHUNK_SIZE, remaining, len(buf) - length)
+            if size <= 0:
+                return False
             try:
-                new_id = self._save_to_db(unique_filename, filename, file_size, file_extension)
-                file_url = f"/images/{unique_filename}"
-                
-                logging.info(f"Изображение '{filename}' сохранено как '{unique_filename}' (id={new_id})")
-                self._set_headers(200, 'application/json')
-                response = {
-                    "status": "success",
-                    "message": "Файл успешно загружен",
-                    "filename": unique_filename,
-                    "url": file_url,
-                    "id": new_id,
-                    "original_name": filename,
-                    "size": file_size,
-                    "file_type": file_extension.lstrip('.')
-                }
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-            except Exception as db_err:
-                # Откатываем сохранение файла при ошибке БД
-                try:
-                    os.remove(target_path)
-                except Exception:
-                    pass
-                logging.error(f"Ошибка записи метаданных в БД: {db_err}")
-                self._send_error(500, "Ошибка сохранения метаданных в БД")
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении файла '{filename}': {e}")
-            self._send_error(500, "Произошла ошибка при сохранении файла")
-            
-    def _send_error(self, status_code, message):
-        """Вспомогательный метод для отправки ошибок в формате JSON"""
-        self._set_headers(status_code, 'application/json')
-        response = {"status": "error", "message": message}
-        self.wfile.write(json.dumps(response).encode('utf-8'))
-        
-    def _parse_multipart(self, raw_body, boundary):
-        """Парсинг multipart/form-data для извлечения файла"""
-        parts = raw_body.split(b'--' + boundary)
-        for part in parts:
-            if b'Content-Disposition: form-data;' in part and b'filename=' in part:
+                received = self._read_body(view[length:length + size])
+            except TimeoutError:
+                self.close_connection = True
+                raise UploadError(408, ERR_UPLOAD_TIMEOUT)
+            if not received:
+                self.close_connection = True
+                raise UploadError(400, ERR_INCOMPLETE_BODY)
+            remaining -= received
+            length += received
+            return True
+
+        def consume(count):
+            # Отбрасывает первые count байт, сдвигая остаток в начало буфера
+            nonlocal length
+            length -= count
+            view[:length] = view[count:count + length]
+
+        def drain():
+            # Небольшой остаток тела дочитываем, чтобы клиент получил ответ, а не обрыв
+            # соединения. Большой не читаем: отказ отправляется сразу, соединение закрывается
+            nonlocal remaining
+            if remaining > UPLOAD_DRAIN_LIMIT:
+                self.close_connection = True
+                return
+            while remaining > 0:
                 try:
-                    headers_end = part.find(b'\r\n\r\n')
-                    headers_str = part[0:headers_end].decode('utf-8')
-                    
-                    filename_match = re.search(r'filename="([^"]+)"', headers_str)
-                    if filename_match:
-                        filename = filename_match.group(1)
-                        file_data = part[headers_end + 4:].strip()  # +4 для \r\n\r\n
-                        return file_data, filename
-                except Exception as e:
-                    logging.error(f"Ошибка при парсинге части multipart: {e}")
-        return None, None
-        
-    def _save_to_db(self, filename, original_name, size, file_extension):
-        """Сохранение метаданных файла в БД"""
-        with get_db_connection() as conn:
+                    received = self._read_body(view[:min(len(buf), remaining)])
+                except TimeoutError:
+                    # Ответ уже определен, остаток тела просто не дочитываем
+                    self.close_connection = True
+                    return
+                if not received:
+                    break
+                remaining -= received
+
+        # Ищем заголовки части, содержащей файл
+        filename = None
+        while filename is None:
+            start = buf.find(delimiter, 0, length)
+            headers_end = buf.find(b'\r\n\r\n', start, length) if start != -1 else -1
+            if headers_end == -1:
+                if start == -1:
+                    # Оставляем хвост на случай, если разделитель разрезан между блоками
+                    consume(max(0, length - len(delimiter)))
+                else:
+                    # Разделитель уже найден — сдвигаем его в начало и дочитываем заголовки
+                    consume(start)
+                if not fill():
+                    # Тело закончилось или заголовки части не помещаются в буфер
+                    drain()
+                    raise UploadError(400, ERR_NO_FILE)
+                continue
+            # Ищем имя файла прямо в байтах буфера, без декодирования всего блока заголовков
+            filename_match = FILENAME_RE.search(buf, start, headers_end)
+            if filename_match:
+                filename = filename_match.group(1).decode('utf-8', 'replace')
+            consume(headers_end + 4)  # +4 для \r\n\r\n
+
+        file_extension = os.path.splitext(filename)[1].lower()
+        if file_extension not in ALLOWED_EXTENSIONS:
+            drain()
+            raise UploadError(400, ERR_BAD_EXTENSION)
+
+        # Проверяем сигнатуру по первым байтам до того, как что-либо писать на диск
+        while length < 8 and fill():
+            pass
+        signatures = IMAGE_SIGNATURES.get(file_extension)
+        if signatures and not buf.startswith(signatures, 0, length):
+            drain()
+            raise UploadError(400, ERR_BAD_SIGNATURE)
+
+        # Хэш считается по тем же срезам буфера, что пишутся на диск, без повторного чтения
+        digest = hashlib.blake2b(digest_size=16)
+        file_size = 0
+        # Пишем напрямую в дескриптор, минуя буфер BufferedWriter
+        fd, temp_path = create_upload_file()
+        try:
+            while True:
+                end = buf.find(terminator, 0, length)
+                if end != -1:
+                    file_size += end
+                    digest.update(view[:end])
+                    write_all(fd, view[:end])
+                    break
+                # Хвост буфера может содержать начало разделителя — придерживаем его
+                safe = length - len(terminator) + 1
+                if safe > 0:
+                    file_size += safe
+                    # Пишем через memoryview, чтобы не копировать срез буфера
+                    digest.update(view[:safe])
+                    write_all(fd, view[:safe])
+                    consume(safe)
+                if file_size > MAX_FILE_SIZE:
+                    break
+                if not fill():
+                    raise UploadError(400, ERR_INCOMPLETE_BODY)
+            if file_size > MAX_FILE_SIZE:
+                drain()
+                raise UploadError(400, ERR_FILE_TOO_LARGE)
+            drain()
+            if file_size == 0:
+                raise UploadError(400, ERR_NO_FILE)
+        except BaseException:
+            discard_upload_file(fd, temp_path)
+            raise
+        unique_filename = f"{digest.hexdigest()}{file_extension}"
+        return filename, unique_filename, file_size, fd, temp_path
+
+    def _save_to_db(self, fd, temp_path, filename, original_name, size, file_extension):
+        """Публикует файл загрузки и сохраняет его метаданные в БД.
+
+        Одинаковые по содержимому загрузки получают одно имя и делят один файл.
+        Публикация и вставка выполняются под блокировкой имени (см. handle_delete).
+        """
+        target_path = os.path.join(UPLOAD_DIR, filename)
+        with db_conn() as conn:
             with conn.cursor() as cursor:
+                # Файл загрузки не синхронизируется fsync, поэтому и коммит не ждет сброса
+                # WAL на диск: при сбое сервера БД теряются последние вставки, но не
+                # целостность. SET LOCAL уходит тем же запросом, что и блокировка
                 cursor.execute(
-                    """
-                    INSERT INTO images (filename, original_name, size, file_type)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id
-                    """,
-                    (filename, original_name, size, file_extension.lstrip('.')),
+                    "SET LOCAL synchronous_commit TO OFF; EXECUTE images_lock_file (%s)", (filename,)
                 )
-                new_id = cursor.fetchone()[0]
-                conn.commit()
-                return new_id
+                try:
+                    publish_upload(fd, temp_path, target_path)
+                    created = True
+                except FileExistsError:
+                    # Такое содержимое уже загружено — новая запись ссылается на тот же файл
+                    created = False
+                try:
+                    cursor.execute(
+                        "EXECUTE images_insert (%s, %s, %s, %s)",
+                        (filename, original_name, size, file_extension.lstrip('.')),
+                    )
+                    new_id = cursor.fetchone()[0]
+                    # Фиксируем здесь, а не на выходе из db_conn: если коммит не удастся,
+                    # созданный файл нужно удалить, пока блокировка имени еще удерживается
+                    conn.commit()
+                except Exception:
+                    # Откатываем сохранение файла при ошибке БД
+                    if created:
+                        try:
+                            os.remove(target_path)
+                        except OSError:
+                            pass
+                    raise
+        adjust_row_count(1)
+        return new_id
+
+
+class PooledHTTPServer(http.server.ThreadingHTTPServer):
+    """HTTP-сервер, обрабатывающий запросы в ограниченном пуле потоков.
+
+    Размер пула задается переменной окружения SERVER_WORKERS и не должен
+    превышать DB_POOL_MAX, иначе потокам может не хватить соединений с БД.
+    При остановке сервер ждет только запросы, которые уже обрабатываются:
+    простаивающие keep-alive соединения закрываются сразу.
+    """
+    # Соединения сверх числа потоков ждут в очереди listen-сокета
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=SERVER_WORKERS, reuse_port=False):
+        self.reuse_port = reuse_port
+        # Создаются до bind: при ошибке bind базовый класс сразу вызывает server_close
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-worker')
+        self._free_workers = threading.BoundedSemaphore(max_workers)
+        self._active_requests = set()
+        self._active_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            # Каждый процесс слушает свой сокет на том же порту, ядро распределяет соединения
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        # Не принимаем в работу больше соединений, чем есть свободных потоков,
+        # иначе очередь исполнителя растет без ограничений
+        self._free_workers.acquire()
+        with self._active_lock:
+            self._active_requests.add(request)
+        self.executor.submit(self._process_and_release, request, client_address)
+
+    def has_free_worker(self) -> bool:
+        """Проверяет, есть ли сейчас свободный поток пула для нового соединения."""
+        if not self._free_workers.acquire(blocking=False):
+            return False
+        self._free_workers.release()
+        return True
+
+    def _process_and_release(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            with self._active_lock:
+                self._active_requests.discard(request)
+            self._free_workers.release()
+
+    def server_close(self):
+        super().server_close()
+        # Потоки пула не демонические, и интерпретатор дожидается их при выходе.
+        # Закрываем чтение у всех соединений: ожидание следующего запроса сразу
+        # получает EOF, а не висит до REQUEST_TIMEOUT
+        with self._active_lock:
+            requests = list(self._active_requests)
+        for request in requests:
+            try:
+                request.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        self.executor.shutdown(wait=False)
 
 
-def run_server(server_class=http.server.HTTPServer, handler_class=ImageHostingHandler, port=8000):
-    """Запускает сервер."""
+def fork_workers(count: int) -> list:
+    """Запускает count - 1 дочерних процессов сервера.
+
+    Соединения с БД и поток записи логов не переживают fork, поэтому пул
+    закрывается заранее (каждый процесс создаст свой), а QueueListener
+    перезапускается в каждом процессе. Возвращает PID дочерних процессов
+    в родителе и пустой список в дочернем процессе.
+    """
+    close_db_pool()
+    _log_listener.stop()
+    children = []
+    for _ in range(count - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = []
+            break
+        children.append(pid)
+    _log_listener.start()
+    return children
+
+
+def run_server(server_class=PooledHTTPServer, handler_class=ImageHostingHandler, port=8000,
+               processes=WORKER_PROCESSES):
+    """Запускает сервер в processes процессах, слушающих порт через SO_REUSEPORT."""
     server_address = ('', port)
-    httpd = server_class(server_address, handler_class)
-    logging.info(f"Сервер запущен на порту {port}")
+    if SERVER_WORKERS > DB_POOL_MAX:
+        # ThreadedConnectionPool не ждет свободного соединения, а выбрасывает PoolError
+        logging.warning(
+            "SERVER_WORKERS=%s больше DB_POOL_MAX=%s: при пиковой нагрузке часть запросов "
+            "получит ошибку БД", SERVER_WORKERS, DB_POOL_MAX
+        )
+    children = []
+    if processes > 1:
+        children = fork_workers(processes)
+        httpd = server_class(server_address, handler_class, reuse_port=True)
+    else:
+        httpd = server_class(server_address, handler_class)
+    # SIGTERM (docker stop) завершает процесс штатно, вместе с дочерними процессами;
+    # PID 1 в контейнере без обработчика SIGTERM игнорирует
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info("Сервер запущен на порту %s (процесс %s, потоков: %s)", port, os.getpid(), SERVER_WORKERS)
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         pass
-    httpd.server_close()
+    finally:
+        httpd.server_close()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
     logging.info("Сервер остановлен.")
 
 